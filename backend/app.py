@@ -1,17 +1,25 @@
 """
 Public Transport Tracker - Flask Backend Application
 Main entry point for the REST API
-SQLite Version for Local Development
+Runs on SQLite or PostgreSQL, see storage.py
 """
 
 import os
-from flask import Flask, jsonify, request
+import threading
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 from datetime import datetime, date, time
-import sqlite3
 import logging
 from json import JSONEncoder
 
+from config import config
+from storage import create_storage
+from replication import SnapshotPublisher, forward_to_primary
+from profiling import Profiler, ProfiledJSONProvider
+from maintenance import MaintenanceWorker, find_archived_delays
+from migrations import migrate, current_version, LATEST_VERSION
+from warmup import warm_page_cache, warm_requests, WARMUP_HEADER
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,143 +39,54 @@ class CustomJSONEncoder(JSONEncoder):
         return super().default(obj)
 
 app.json_encoder = CustomJSONEncoder
+app.json = ProfiledJSONProvider(app)
 
 # -----------------------
-# Database configuration (SQLite)
+# Storage backend (selected by DB_TYPE in config.py)
 # -----------------------
-# Use /app/database for containerized environment, otherwise use relative path
-if os.path.exists('/app/database'):
-    DB_PATH = '/app/database/transport_db.sqlite'
-else:
-    DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'transport_db.sqlite')
-
-# Initialize database if it doesn't exist
-def init_database():
-    """Initialize database with schema if it doesn't exist"""
-    if not os.path.exists(DB_PATH):
-        logger.info(f"Initializing database at {DB_PATH}")
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Execute schema directly
-        schema = """
-        -- SQLite Database Schema
-        DROP TABLE IF EXISTS user_favorites;
-        DROP TABLE IF EXISTS users;
-        DROP TABLE IF EXISTS delays;
-        DROP TABLE IF EXISTS schedules;
-        DROP TABLE IF EXISTS stations;
-        DROP TABLE IF EXISTS routes;
-
-        CREATE TABLE routes (
-            route_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            route_name VARCHAR(100) NOT NULL,
-            route_type VARCHAR(20) NOT NULL CHECK (route_type IN ('bus', 'train')),
-            operator VARCHAR(100),
-            start_station VARCHAR(100) NOT NULL,
-            end_station VARCHAR(100) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE INDEX idx_routes_type ON routes(route_type);
-        CREATE INDEX idx_routes_operator ON routes(operator);
-
-        CREATE TABLE stations (
-            station_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            station_name VARCHAR(100) NOT NULL UNIQUE,
-            station_type VARCHAR(20) CHECK (station_type IN ('bus_stop', 'train_station')),
-            latitude DECIMAL(10, 8),
-            longitude DECIMAL(11, 8),
-            address TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE INDEX idx_stations_name ON stations(station_name);
-        CREATE INDEX idx_stations_type ON stations(station_type);
-
-        CREATE TABLE schedules (
-            schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
-            departure_station_id INT NOT NULL REFERENCES stations(station_id),
-            arrival_station_id INT NOT NULL REFERENCES stations(station_id),
-            departure_time TIME NOT NULL,
-            arrival_time TIME NOT NULL,
-            day_of_week VARCHAR(20),
-            frequency INT DEFAULT 15,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            CHECK (arrival_time > departure_time)
-        );
-        CREATE INDEX idx_schedules_route ON schedules(route_id);
-        CREATE INDEX idx_schedules_day ON schedules(day_of_week);
-        CREATE INDEX idx_schedules_departure_station ON schedules(departure_station_id);
-        CREATE INDEX idx_schedules_arrival_station ON schedules(arrival_station_id);
-
-        CREATE TABLE delays (
-            delay_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            schedule_id INT NOT NULL REFERENCES schedules(schedule_id) ON DELETE CASCADE,
-            delay_minutes INT NOT NULL DEFAULT 0,
-            reason TEXT,
-            reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT TRUE,
-            resolved_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            CHECK (delay_minutes >= 0)
-        );
-        CREATE INDEX idx_delays_schedule ON delays(schedule_id);
-        CREATE INDEX idx_delays_active ON delays(is_active);
-        CREATE INDEX idx_delays_reported ON delays(reported_at);
-
-        CREATE TABLE users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username VARCHAR(50) NOT NULL UNIQUE,
-            email VARCHAR(100) NOT NULL UNIQUE,
-            password_hash VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE INDEX idx_users_username ON users(username);
-        CREATE INDEX idx_users_email ON users(email);
-
-        CREATE TABLE user_favorites (
-            favorite_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, route_id)
-        );
-        CREATE INDEX idx_user_favorites_user ON user_favorites(user_id);
-        CREATE INDEX idx_user_favorites_route ON user_favorites(route_id);
-        """
-        
-        cursor.executescript(schema)
-        conn.commit()
-        logger.info("Database initialized successfully")
-        conn.close()
-    else:
-        logger.info(f"Using existing database at {DB_PATH}")
-
-# Database connection helper
-def get_db_connection():
-    """Establish connection to SQLite database"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f"Database connection error: {e}")
-        raise
-
-def dict_from_row(row):
-    """Convert sqlite3.Row to dict"""
-    if row is None:
-        return None
-    return dict(row)
-
-# Initialize database on startup
-init_database()
+app_config = config.get(os.getenv('FLASK_ENV', 'default'), config['default'])
+app.config.from_object(app_config)
+
+storage = create_storage(app_config)
+
+# Schema migrations run once per deployment (python migrations.py as a
+# deploy hook) or, with MIGRATE_ON_START, once per pod in the gunicorn
+# arbiter when the app is preloaded
+if storage.read_only:
+    if not storage.refresh(force=True):
+        logger.warning(f"No snapshot published yet in {app_config.SNAPSHOT_DIR}")
+elif app_config.MIGRATE_ON_START:
+    migrate(storage)
+elif current_version(storage) < LATEST_VERSION:
+    logger.error(f"Database schema is behind version {LATEST_VERSION}; run python migrations.py")
+
+# Prime the OS page cache; shared by every worker forked from here
+if app_config.WARMUP_ENABLED and storage.dialect == 'sqlite' and storage.path:
+    warm_page_cache(storage.path, app_config.WARMUP_MAX_MB * 1024 * 1024)
+
+profiler = Profiler(sample_rate=app_config.PROFILE_SAMPLE_RATE,
+                    admin_token=app_config.PROFILE_ADMIN_TOKEN,
+                    max_captures=app_config.PROFILE_MAX_CAPTURES)
+
+# Delay history maintenance runs only where writes are allowed; its thread
+# and the snapshot publisher's are started per worker by start_background()
+maintenance = None
+if not storage.read_only:
+    maintenance = MaintenanceWorker(
+        storage, app_config.MAINTENANCE_LOCK_DIR,
+        interval=app_config.MAINTENANCE_INTERVAL,
+        auto_resolve_hours=app_config.DELAY_AUTO_RESOLVE_HOURS,
+        archive_after_days=app_config.DELAY_ARCHIVE_AFTER_DAYS,
+        batch_size=app_config.ARCHIVE_BATCH_SIZE,
+        vacuum_pages=app_config.VACUUM_PAGES,
+        window_start=app_config.MAINTENANCE_WINDOW_START,
+        window_end=app_config.MAINTENANCE_WINDOW_END)
+
+# SQLite primary publishes snapshots for read replicas
+publisher = None
+if app_config.DB_TYPE == 'sqlite' and app_config.SQLITE_ROLE == 'primary':
+    publisher = SnapshotPublisher(app_config.SQLITE_PATH, app_config.SNAPSHOT_DIR,
+                                  interval=app_config.SNAPSHOT_INTERVAL, keep=app_config.SNAPSHOT_KEEP)
 
 # -----------------------
 # Error helper
@@ -183,6 +102,73 @@ def not_found(e):
 def internal_error(e):
     return error_response('Internal server error', 500)
 
+# -----------------------
+# Request profiling
+# -----------------------
+# Warm-up replays run inside the worker and are not real traffic
+def _is_warmup():
+    return WARMUP_HEADER in request.headers
+
+@app.before_request
+def start_profiling():
+    """Sample a fraction of requests; capture one on demand via X-Profile"""
+    if _is_warmup():
+        return None
+    capture_mode = None
+    if 'X-Profile' in request.headers and profiler.is_admin(request.headers.get('X-Admin-Token')):
+        capture_mode = request.headers['X-Profile'].lower()
+    elif not profiler.sample_rate:
+        return None
+    # One shared key for unmatched URLs, so junk paths cannot grow the stats
+    endpoint = request.url_rule.rule if request.url_rule else '<unmatched>'
+    profiler.begin(endpoint, capture_mode)
+    return None
+
+@app.after_request
+def finish_profiling(response):
+    """Record the profiled request; admins also get its phases as Server-Timing"""
+    if _is_warmup():
+        return response
+    recorder = profiler.end()
+    if recorder is not None and profiler.is_admin(request.headers.get('X-Admin-Token')):
+        response.headers['Server-Timing'] = recorder.server_timing()
+        if recorder.mode is not None:
+            response.headers['X-Profile-Id'] = str(recorder.capture_id)
+    return response
+
+@app.teardown_request
+def discard_profiling(exc):
+    if not _is_warmup():
+        profiler.discard()
+
+# -----------------------
+# Read-replica routing
+# -----------------------
+@app.before_request
+def route_replica_request():
+    """On a read replica, pick up new snapshots and forward writes
+
+    Admin routes act on this process (profiler, maintenance) and are
+    never forwarded.
+    """
+    if not storage.read_only:
+        return None
+    storage.refresh()
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or request.path.startswith('/api/admin/'):
+        return None
+    try:
+        return forward_to_primary(app_config.PRIMARY_URL, request)
+    except Exception as e:
+        logger.error(f"Write forwarding to primary failed: {e}")
+        return error_response('Primary database unavailable', 503)
+
+@app.after_request
+def report_staleness(response):
+    """Tell clients how old the replica data they just read is"""
+    if storage.read_only and storage.staleness() is not None:
+        response.headers['X-Snapshot-Age'] = f'{storage.staleness():.1f}'
+    return response
+
 # ============================================================================
 # HEALTH CHECK ENDPOINTS
 # ============================================================================
@@ -200,14 +186,27 @@ def root():
 def health_check():
     """Health check endpoint"""
     try:
-        conn = get_db_connection()
-        conn.close()
-        return jsonify({
+        # No-op once post_fork or __main__ has warmed this worker
+        warm_worker()
+        storage.ping()
+        body = {
             'status': 'healthy',
             'service': 'public-transport-tracker-api',
             'timestamp': datetime.utcnow().isoformat() + 'Z',
-            'database': 'connected'
-        }), 200
+            'database': 'connected',
+            'backend': storage.name
+        }
+        if storage.read_only:
+            staleness = storage.staleness()
+            body['replication'] = {
+                'snapshot_generation': storage.generation,
+                'staleness_seconds': round(staleness, 1),
+                'max_staleness_seconds': app_config.REPLICA_MAX_STALENESS
+            }
+            if staleness > app_config.REPLICA_MAX_STALENESS:
+                body['status'] = 'stale'
+                return jsonify(body), 503
+        return jsonify(body), 200
     except Exception as e:
         return jsonify({
             'status': 'unhealthy',
@@ -222,7 +221,7 @@ def api_info():
     return jsonify({
         'service': 'Public Transport Tracker API',
         'version': '1.0.0',
-        'database': 'SQLite (Local Development)',
+        'database': storage.name,
         'endpoints': {
             'routes': '/api/routes',
             'stations': '/api/stations',
@@ -240,11 +239,8 @@ def api_info():
 def get_routes():
     """Get all routes"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM routes ORDER BY route_id')
-        routes = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        with storage.session() as db:
+            routes = db.fetch_all('SELECT * FROM routes ORDER BY route_id')
         return jsonify({'status': 'success', 'data': routes}), 200
     except Exception as e:
         return error_response(str(e), 500)
@@ -253,11 +249,8 @@ def get_routes():
 def get_route(route_id):
     """Get specific route"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM routes WHERE route_id = ?', (route_id,))
-        route = dict_from_row(cur.fetchone())
-        conn.close()
+        with storage.session() as db:
+            route = db.fetch_one('SELECT * FROM routes WHERE route_id = ?', (route_id,))
         if not route:
             return error_response(f'Route {route_id} not found', 404)
         return jsonify({'status': 'success', 'data': route}), 200
@@ -273,17 +266,14 @@ def create_route():
         if not all(field in data for field in required):
             return error_response('Missing required fields', 400)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            '''INSERT INTO routes (route_name, route_type, operator, start_station, end_station)
-               VALUES (?, ?, ?, ?, ?)''',
-            (data['route_name'], data['route_type'], data.get('operator'),
-             data['start_station'], data['end_station'])
-        )
-        route_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        with storage.session() as db:
+            route_id = db.insert(
+                '''INSERT INTO routes (route_name, route_type, operator, start_station, end_station)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (data['route_name'], data['route_type'], data.get('operator'),
+                 data['start_station'], data['end_station']),
+                'route_id'
+            )
         return jsonify({'status': 'success', 'data': {'route_id': route_id, 'message': 'Route created successfully'}}), 201
     except Exception as e:
         return error_response(str(e), 500)
@@ -296,11 +286,8 @@ def create_route():
 def get_stations():
     """Get all stations"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM stations ORDER BY station_id')
-        stations = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        with storage.session() as db:
+            stations = db.fetch_all('SELECT * FROM stations ORDER BY station_id')
         return jsonify({'status': 'success', 'data': stations}), 200
     except Exception as e:
         return error_response(str(e), 500)
@@ -309,11 +296,8 @@ def get_stations():
 def get_station(station_id):
     """Get specific station"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM stations WHERE station_id = ?', (station_id,))
-        station = dict_from_row(cur.fetchone())
-        conn.close()
+        with storage.session() as db:
+            station = db.fetch_one('SELECT * FROM stations WHERE station_id = ?', (station_id,))
         if not station:
             return error_response(f'Station {station_id} not found', 404)
         return jsonify({'status': 'success', 'data': station}), 200
@@ -327,17 +311,14 @@ def create_station():
         data = request.get_json()
         if 'station_name' not in data:
             return error_response('Missing required field: station_name', 400)
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            '''INSERT INTO stations (station_name, station_type, latitude, longitude, address)
-               VALUES (?, ?, ?, ?, ?)''',
-            (data['station_name'], data.get('station_type'), data.get('latitude'),
-             data.get('longitude'), data.get('address'))
-        )
-        station_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        with storage.session() as db:
+            station_id = db.insert(
+                '''INSERT INTO stations (station_name, station_type, latitude, longitude, address)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (data['station_name'], data.get('station_type'), data.get('latitude'),
+                 data.get('longitude'), data.get('address')),
+                'station_id'
+            )
         return jsonify({'status': 'success', 'data': {'station_id': station_id, 'message': 'Station created successfully'}}), 201
     except Exception as e:
         return error_response(str(e), 500)
@@ -352,8 +333,6 @@ def get_schedules():
     try:
         route_id = request.args.get('route_id')
         day_of_week = request.args.get('day_of_week')
-        conn = get_db_connection()
-        cur = conn.cursor()
 
         query = '''SELECT s.schedule_id, s.route_id, r.route_name,
                           ds.station_name as departure_station,
@@ -374,9 +353,8 @@ def get_schedules():
             params.append(day_of_week)
 
         query += ' ORDER BY s.schedule_id'
-        cur.execute(query, params)
-        schedules = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        with storage.session() as db:
+            schedules = db.fetch_all(query, params)
 
         return jsonify({'status': 'success', 'data': schedules}), 200
     except Exception as e:
@@ -386,19 +364,16 @@ def get_schedules():
 def get_schedule(schedule_id):
     """Get specific schedule"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('''SELECT s.schedule_id, s.route_id, r.route_name,
-                              ds.station_name as departure_station,
-                              asst.station_name as arrival_station,
-                              s.departure_time, s.arrival_time, s.day_of_week, s.frequency
-                       FROM schedules s
-                       JOIN routes r ON s.route_id = r.route_id
-                       JOIN stations ds ON s.departure_station_id = ds.station_id
-                       JOIN stations asst ON s.arrival_station_id = asst.station_id
-                       WHERE s.schedule_id = ?''', (schedule_id,))
-        schedule = dict_from_row(cur.fetchone())
-        conn.close()
+        with storage.session() as db:
+            schedule = db.fetch_one('''SELECT s.schedule_id, s.route_id, r.route_name,
+                                              ds.station_name as departure_station,
+                                              asst.station_name as arrival_station,
+                                              s.departure_time, s.arrival_time, s.day_of_week, s.frequency
+                                       FROM schedules s
+                                       JOIN routes r ON s.route_id = r.route_id
+                                       JOIN stations ds ON s.departure_station_id = ds.station_id
+                                       JOIN stations asst ON s.arrival_station_id = asst.station_id
+                                       WHERE s.schedule_id = ?''', (schedule_id,))
         if not schedule:
             return error_response(f'Schedule {schedule_id} not found', 404)
         return jsonify({'status': 'success', 'data': schedule}), 200
@@ -409,19 +384,16 @@ def get_schedule(schedule_id):
 def get_route_schedules(route_id):
     """Get all schedules for a specific route"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('''SELECT s.schedule_id, s.route_id, r.route_name,
-                              ds.station_name as departure_station,
-                              asst.station_name as arrival_station,
-                              s.departure_time, s.arrival_time, s.day_of_week, s.frequency
-                       FROM schedules s
-                       JOIN routes r ON s.route_id = r.route_id
-                       JOIN stations ds ON s.departure_station_id = ds.station_id
-                       JOIN stations asst ON s.arrival_station_id = asst.station_id
-                       WHERE s.route_id = ? ORDER BY s.schedule_id''', (route_id,))
-        schedules = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        with storage.session() as db:
+            schedules = db.fetch_all('''SELECT s.schedule_id, s.route_id, r.route_name,
+                                               ds.station_name as departure_station,
+                                               asst.station_name as arrival_station,
+                                               s.departure_time, s.arrival_time, s.day_of_week, s.frequency
+                                        FROM schedules s
+                                        JOIN routes r ON s.route_id = r.route_id
+                                        JOIN stations ds ON s.departure_station_id = ds.station_id
+                                        JOIN stations asst ON s.arrival_station_id = asst.station_id
+                                        WHERE s.route_id = ? ORDER BY s.schedule_id''', (route_id,))
         return jsonify({'status': 'success', 'data': schedules}), 200
     except Exception as e:
         return error_response(str(e), 500)
@@ -442,18 +414,15 @@ def create_schedule():
         missing = [field for field in required if data.get(field) in (None, '')]
         if missing:
             return error_response(f"Missing required fields: {', '.join(missing)}", 400)
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            '''INSERT INTO schedules (route_id, departure_station_id, arrival_station_id,
-                                     departure_time, arrival_time, day_of_week, frequency)
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (data['route_id'], data['departure_station_id'], data['arrival_station_id'],
-             data['departure_time'], data['arrival_time'], data.get('day_of_week'), data.get('frequency', 15))
-        )
-        schedule_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        with storage.session() as db:
+            schedule_id = db.insert(
+                '''INSERT INTO schedules (route_id, departure_station_id, arrival_station_id,
+                                         departure_time, arrival_time, day_of_week, frequency)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (data['route_id'], data['departure_station_id'], data['arrival_station_id'],
+                 data['departure_time'], data['arrival_time'], data.get('day_of_week'), data.get('frequency', 15)),
+                'schedule_id'
+            )
         return jsonify({'status': 'success', 'data': {'schedule_id': schedule_id, 'message': 'Schedule created successfully'}}), 201
     except Exception as e:
         return error_response(str(e), 500)
@@ -469,9 +438,6 @@ def get_delays():
         is_active = request.args.get('is_active', 'true').lower() == 'true'
         route_id = request.args.get('route_id')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         query = '''SELECT d.delay_id, d.schedule_id, r.route_name, s.departure_time,
                           d.delay_minutes, d.reason, d.reported_at, d.is_active
                    FROM delays d
@@ -479,16 +445,15 @@ def get_delays():
                    JOIN routes r ON s.route_id = r.route_id
                    WHERE d.is_active = ?'''
         
-        params = [1 if is_active else 0]
+        params = [is_active]
         
         if route_id:
             query += ' AND r.route_id = ?'
             params.append(route_id)
         
         query += ' ORDER BY d.reported_at DESC'
-        cur.execute(query, params)
-        delays = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        with storage.session() as db:
+            delays = db.fetch_all(query, params)
         
         return jsonify({
             'status': 'success',
@@ -501,18 +466,24 @@ def get_delays():
 def get_delay(delay_id):
     """Get specific delay by ID"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''SELECT d.delay_id, d.schedule_id, r.route_name,
-                              d.delay_minutes, d.reason, d.reported_at, d.is_active
-                       FROM delays d
-                       JOIN schedules s ON d.schedule_id = s.schedule_id
-                       JOIN routes r ON s.route_id = r.route_id
-                       WHERE d.delay_id = ?''', (delay_id,))
-        
-        delay = dict_from_row(cur.fetchone())
-        conn.close()
+        with storage.session() as db:
+            delay = db.fetch_one('''SELECT d.delay_id, d.schedule_id, r.route_name,
+                                           d.delay_minutes, d.reason, d.reported_at, d.is_active
+                                    FROM delays d
+                                    JOIN schedules s ON d.schedule_id = s.schedule_id
+                                    JOIN routes r ON s.route_id = r.route_id
+                                    WHERE d.delay_id = ?''', (delay_id,))
+            if not delay:
+                # Fall back to the archive for old resolved delays
+                archived = find_archived_delays(db, delay_id=delay_id)
+                if archived:
+                    delay = {key: archived[0][key] for key in
+                             ('delay_id', 'schedule_id', 'delay_minutes', 'reason',
+                              'reported_at', 'is_active', 'resolved_at', 'archived')}
+                    route = db.fetch_one('''SELECT r.route_name FROM schedules s
+                                             JOIN routes r ON s.route_id = r.route_id
+                                             WHERE s.schedule_id = ?''', (delay['schedule_id'],))
+                    delay['route_name'] = route['route_name'] if route else None
         
         if not delay:
             return error_response(f'Delay {delay_id} not found', 404)
@@ -526,18 +497,20 @@ def get_delay(delay_id):
 
 @app.route('/api/schedules/<int:schedule_id>/delays', methods=['GET'])
 def get_schedule_delays(schedule_id):
-    """Get all delays for a specific schedule"""
+    """Get all delays for a specific schedule (include_archived=true adds history)"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''SELECT delay_id, delay_minutes, reason, reported_at, is_active
-                       FROM delays
-                       WHERE schedule_id = ?
-                       ORDER BY reported_at DESC''', (schedule_id,))
-        
-        delays = [dict(row) for row in cur.fetchall()]
-        conn.close()
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        with storage.session() as db:
+            delays = db.fetch_all('''SELECT delay_id, delay_minutes, reason, reported_at, is_active
+                                     FROM delays
+                                     WHERE schedule_id = ?
+                                     ORDER BY reported_at DESC''', (schedule_id,))
+            if include_archived:
+                delays += [
+                    {key: row[key] for key in
+                     ('delay_id', 'delay_minutes', 'reason', 'reported_at', 'is_active', 'archived')}
+                    for row in find_archived_delays(db, schedule_id=schedule_id)
+                ]
         
         return jsonify({
             'status': 'success',
@@ -556,18 +529,13 @@ def create_delay():
         if 'schedule_id' not in data or 'delay_minutes' not in data:
             return error_response('Missing required fields: schedule_id, delay_minutes', 400)
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            '''INSERT INTO delays (schedule_id, delay_minutes, reason, is_active)
-               VALUES (?, ?, ?, ?)''',
-            (data['schedule_id'], data['delay_minutes'], data.get('reason'), True)
-        )
-        
-        delay_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        with storage.session() as db:
+            delay_id = db.insert(
+                '''INSERT INTO delays (schedule_id, delay_minutes, reason, is_active)
+                   VALUES (?, ?, ?, ?)''',
+                (data['schedule_id'], data['delay_minutes'], data.get('reason'), True),
+                'delay_id'
+            )
         
         return jsonify({
             'status': 'success',
@@ -582,25 +550,20 @@ def update_delay(delay_id):
     try:
         data = request.get_json()
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         if 'is_active' in data:
-            if not data['is_active']:
-                cur.execute(
-                    '''UPDATE delays SET is_active = 0, resolved_at = CURRENT_TIMESTAMP
-                       WHERE delay_id = ?''',
-                    (delay_id,)
-                )
-            else:
-                cur.execute(
-                    '''UPDATE delays SET is_active = 1, resolved_at = NULL
-                       WHERE delay_id = ?''',
-                    (delay_id,)
-                )
-            conn.commit()
-        
-        conn.close()
+            with storage.session() as db:
+                if not data['is_active']:
+                    db.execute(
+                        '''UPDATE delays SET is_active = FALSE, resolved_at = CURRENT_TIMESTAMP
+                           WHERE delay_id = ?''',
+                        (delay_id,)
+                    )
+                else:
+                    db.execute(
+                        '''UPDATE delays SET is_active = TRUE, resolved_at = NULL
+                           WHERE delay_id = ?''',
+                        (delay_id,)
+                    )
         
         return jsonify({
             'status': 'success',
@@ -623,36 +586,32 @@ def search():
         if not query_str:
             return error_response('Search query cannot be empty', 400)
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         results = {'routes': [], 'schedules': []}
         search_pattern = f'%{query_str}%'
         
-        if search_type in ['all', 'route']:
-            cur.execute('''SELECT * FROM routes
-                          WHERE route_name LIKE ? OR operator LIKE ?
-                          ORDER BY route_id''',
-                       (search_pattern, search_pattern))
-            results['routes'] = [dict(row) for row in cur.fetchall()]
-        
-        if search_type in ['all', 'schedule']:
-            cur.execute('''SELECT s.schedule_id, s.route_id, r.route_name,
-                                  ds.station_name as departure_station,
-                                  asst.station_name as arrival_station,
-                                  s.departure_time, s.arrival_time
-                           FROM schedules s
-                           JOIN routes r ON s.route_id = r.route_id
-                           JOIN stations ds ON s.departure_station_id = ds.station_id
-                           JOIN stations asst ON s.arrival_station_id = asst.station_id
-                           WHERE r.route_name LIKE ? OR
-                                 ds.station_name LIKE ? OR
-                                 asst.station_name LIKE ?
-                           ORDER BY s.schedule_id''',
-                       (search_pattern, search_pattern, search_pattern))
-            results['schedules'] = [dict(row) for row in cur.fetchall()]
-        
-        conn.close()
+        with storage.session() as db:
+            if search_type in ['all', 'route']:
+                results['routes'] = db.fetch_all(
+                    '''SELECT * FROM routes
+                       WHERE LOWER(route_name) LIKE LOWER(?) OR LOWER(operator) LIKE LOWER(?)
+                       ORDER BY route_id''',
+                    (search_pattern, search_pattern))
+            
+            if search_type in ['all', 'schedule']:
+                results['schedules'] = db.fetch_all(
+                    '''SELECT s.schedule_id, s.route_id, r.route_name,
+                              ds.station_name as departure_station,
+                              asst.station_name as arrival_station,
+                              s.departure_time, s.arrival_time
+                       FROM schedules s
+                       JOIN routes r ON s.route_id = r.route_id
+                       JOIN stations ds ON s.departure_station_id = ds.station_id
+                       JOIN stations asst ON s.arrival_station_id = asst.station_id
+                       WHERE LOWER(r.route_name) LIKE LOWER(?) OR
+                             LOWER(ds.station_name) LIKE LOWER(?) OR
+                             LOWER(asst.station_name) LIKE LOWER(?)
+                       ORDER BY s.schedule_id''',
+                    (search_pattern, search_pattern, search_pattern))
         
         return jsonify({
             'status': 'success',
@@ -661,9 +620,120 @@ def search():
     except Exception as e:
         return error_response(str(e), 500)
 
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+def require_admin():
+    """Return an error response unless X-Admin-Token is valid"""
+    if not profiler.is_admin(request.headers.get('X-Admin-Token')):
+        return error_response('Admin token required', 403)
+    return None
+
+@app.route('/api/admin/profile', methods=['GET'])
+def get_profile_summary():
+    """Aggregated phase timings and the list of stored captures"""
+    denied = require_admin()
+    if denied:
+        return denied
+    return jsonify({'status': 'success', 'data': profiler.summary()}), 200
+
+@app.route('/api/admin/profile', methods=['DELETE'])
+def reset_profile():
+    """Clear aggregated timings and captures"""
+    denied = require_admin()
+    if denied:
+        return denied
+    profiler.reset()
+    return jsonify({'status': 'success', 'data': {'message': 'Profile data cleared'}}), 200
+
+@app.route('/api/admin/profile/flamegraph', methods=['GET'])
+def get_flamegraph():
+    """Folded stacks from all sampled captures (flamegraph.pl / speedscope)"""
+    denied = require_admin()
+    if denied:
+        return denied
+    return Response(profiler.flamegraph(), mimetype='text/plain')
+
+@app.route('/api/admin/profile/<int:capture_id>', methods=['GET'])
+def get_profile_capture(capture_id):
+    """Raw output of one capture: pstats text or folded stacks"""
+    denied = require_admin()
+    if denied:
+        return denied
+    record = profiler.capture(capture_id)
+    if not record:
+        return error_response(f'Capture {capture_id} not found', 404)
+    return Response(record['output'], mimetype='text/plain')
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+def get_maintenance_status():
+    """Report of the last delay maintenance run in this process"""
+    denied = require_admin()
+    if denied:
+        return denied
+    if maintenance is None:
+        return error_response('Maintenance is not available on a read replica', 409)
+    return jsonify({'status': 'success', 'data': {
+        'enabled': app_config.MAINTENANCE_ENABLED,
+        'last_run': maintenance.last_report()
+    }}), 200
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+def run_maintenance():
+    """Run delay maintenance now; {"vacuum": true} also vacuums"""
+    denied = require_admin()
+    if denied:
+        return denied
+    if maintenance is None:
+        return error_response('Maintenance is not available on a read replica', 409)
+    data = request.get_json(silent=True) or {}
+    report = maintenance.run_once(vacuum=bool(data.get('vacuum', False)))
+    if report is None:
+        return error_response('Delay maintenance is already running', 409)
+    return jsonify({'status': 'success', 'data': report}), 200
+
+# ============================================================================
+# WARM-UP
+# ============================================================================
+
+_warmed = threading.Event()
+_warm_lock = threading.Lock()
+
+def warm_worker():
+    """Prime this worker before it takes traffic
+
+    Called from the gunicorn post_fork hook and the development server;
+    /api/health calls it too, so a worker started by any other launcher
+    warms up once, on its first health check.
+    """
+    if _warmed.is_set():
+        return
+    with _warm_lock:
+        if _warmed.is_set():
+            return
+        if app_config.WARMUP_ENABLED:
+            elapsed = warm_requests(app)
+            logger.info(f"Worker {os.getpid()} warmed up in {elapsed * 1000:.0f} ms")
+        _warmed.set()
+
+def start_background():
+    """Start this worker's maintenance and snapshot threads
+
+    Called after the fork, never at import: under --preload the arbiter
+    must not hold threads or connections. Each worker starts them and
+    the flocks inside pick one to do the work.
+    """
+    if maintenance is not None and app_config.MAINTENANCE_ENABLED:
+        maintenance.start()
+    if publisher is not None:
+        publisher.start()
+
 # ============================================================================
 # APPLICATION ENTRY POINT
 # ============================================================================
 
 if __name__ == '__main__':
+    warm_worker()
+    start_background()
     app.run(host='0.0.0.0', port=5000, debug=True)
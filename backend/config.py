@@ -4,6 +4,7 @@ Load settings from environment variables
 """
 
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -14,11 +15,51 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     
     # Database settings
+    # DB_TYPE selects the storage backend: 'sqlite' or 'postgresql'
+    DB_TYPE = os.getenv('DB_TYPE', 'sqlite')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', '/app/database/transport_db.sqlite'
+                            if os.path.exists('/app/database')
+                            else os.path.join(os.path.dirname(__file__), '..', 'database', 'transport_db.sqlite'))
+    # SQLite replication: 'standalone', 'primary' (publishes snapshots)
+    # or 'replica' (serves snapshots read-only, forwards writes to PRIMARY_URL)
+    SQLITE_ROLE = os.getenv('SQLITE_ROLE', 'standalone')
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(SQLITE_PATH), 'snapshots'))
+    SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '30'))
+    SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '3'))
+    SNAPSHOT_POLL_INTERVAL = int(os.getenv('SNAPSHOT_POLL_INTERVAL', '2'))
+    REPLICA_MAX_STALENESS = int(os.getenv('REPLICA_MAX_STALENESS', '120'))
+    PRIMARY_URL = os.getenv('PRIMARY_URL', 'http://backend-sqlite-primary:5000')
     DB_HOST = os.getenv('DB_HOST', 'localhost')
     DB_PORT = os.getenv('DB_PORT', '5432')
     DB_NAME = os.getenv('DB_NAME', 'transport_db')
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+    DB_STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', '500'))
+    
+    # Startup: MIGRATE_ON_START=false when a deploy hook runs migrations.py
+    MIGRATE_ON_START = os.getenv('MIGRATE_ON_START', 'true').lower() == 'true'
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_MAX_MB = int(os.getenv('WARMUP_MAX_MB', '256'))
+    
+    # Delay history maintenance (off-peak window hours are UTC)
+    MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', 'true').lower() == 'true'
+    MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', '3600'))
+    # Pod-local, writable directory for the worker flocks and last-run report
+    MAINTENANCE_LOCK_DIR = os.getenv('MAINTENANCE_LOCK_DIR', tempfile.gettempdir())
+    DELAY_AUTO_RESOLVE_HOURS = int(os.getenv('DELAY_AUTO_RESOLVE_HOURS', '12'))
+    DELAY_ARCHIVE_AFTER_DAYS = int(os.getenv('DELAY_ARCHIVE_AFTER_DAYS', '30'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+    VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', '1000'))
+    MAINTENANCE_WINDOW_START = int(os.getenv('MAINTENANCE_WINDOW_START', '2'))
+    MAINTENANCE_WINDOW_END = int(os.getenv('MAINTENANCE_WINDOW_END', '5'))
+    
+    # Profiling (PROFILE_SAMPLE_RATE=0 disables sampling; admin endpoints
+    # and per-request captures need PROFILE_ADMIN_TOKEN)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+    PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', '20'))
     
     # CORS settings
     CORS_HEADERS = 'Content-Type'
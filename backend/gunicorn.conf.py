@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for the Flask backend
+The app is preloaded so migrations and page-cache warm-up run once in the
+arbiter; each worker then warms its own connections and starts its
+background threads before serving
+"""
+
+import os
+
+bind = '0.0.0.0:5000'
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = 60
+preload_app = True
+
+
+def when_ready(server):
+    # Drop connections opened while preloading; workers open their own
+    from app import storage
+    storage.close()
+
+
+def post_fork(server, worker):
+    from app import warm_worker, start_background
+    warm_worker()
+    start_background()
@@ -0,0 +1,263 @@
+"""
+Delay history maintenance
+Auto-resolves stale delays, archives old resolved delays into compressed
+monthly chunks, and vacuums/analyzes the hot table off-peak
+"""
+
+import os
+import json
+import time
+import zlib
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Held by the gunicorn worker that runs the background loop
+LOCK_NAME = '.maintenance.lock'
+# Held for the duration of one run, scheduled or triggered by an admin
+RUN_LOCK_NAME = '.maintenance.run.lock'
+# Report of the last run, readable by every worker
+LAST_RUN_NAME = '.maintenance.last.json'
+
+# Arbitrary key for pg_try_advisory_lock so only one pod runs at a time
+MAINTENANCE_LOCK_KEY = 72290029
+
+# Age cutoffs use the database clock: rows are stamped with CURRENT_TIMESTAMP,
+# which SQLite stores in UTC and PostgreSQL in the session time zone
+CUTOFF_SQL = {
+    'sqlite': "SELECT datetime('now', ?) AS cutoff",
+    'postgresql': 'SELECT LOCALTIMESTAMP + CAST(? AS INTERVAL) AS cutoff',
+}
+
+
+def _cutoff(db, dialect, age):
+    """Database time ``age`` ago (e.g. ``'12 hours'``), comparable to stored timestamps"""
+    return db.fetch_one(CUTOFF_SQL[dialect], (f'-{age}',))['cutoff']
+
+# ============================================================================
+# MAINTENANCE STEPS
+# ============================================================================
+
+def resolve_stale_delays(storage, max_age_hours):
+    """Mark active delays older than ``max_age_hours`` as resolved"""
+    with storage.session() as db:
+        cutoff = _cutoff(db, storage.dialect, f'{max_age_hours} hours')
+        return db.execute(
+            '''UPDATE delays SET is_active = FALSE, resolved_at = CURRENT_TIMESTAMP,
+                                 updated_at = CURRENT_TIMESTAMP
+               WHERE is_active = TRUE AND reported_at < ?''',
+            (cutoff,)
+        )
+
+
+# Lock the batch before reading it, so a concurrent PUT /api/delays/<id>
+# cannot reactivate a row between the SELECT and its DELETE
+ARCHIVE_SELECT_SQL = {
+    'sqlite': '''SELECT * FROM delays
+                 WHERE is_active = FALSE AND resolved_at < ?
+                 ORDER BY delay_id LIMIT ?''',
+    'postgresql': '''SELECT * FROM delays
+                     WHERE is_active = FALSE AND resolved_at < ?
+                     ORDER BY delay_id LIMIT ?
+                     FOR UPDATE''',
+}
+
+
+def _archive_batch(storage, cutoff, batch_size):
+    with storage.session() as db:
+        if storage.dialect == 'sqlite':
+            # sqlite3 would only BEGIN at the first write; take the write lock now
+            db.execute('BEGIN IMMEDIATE')
+        rows = db.fetch_all(ARCHIVE_SELECT_SQL[storage.dialect], (cutoff, batch_size))
+
+        # Delete by exact id and archive only what was actually removed
+        archived = [
+            row for row in rows
+            if db.execute('DELETE FROM delays WHERE delay_id = ? AND is_active = FALSE',
+                          (row['delay_id'],))
+        ]
+
+        by_month = {}
+        for row in archived:
+            by_month.setdefault(str(row['reported_at'])[:7], []).append(row)
+
+        for month, month_rows in by_month.items():
+            payload = zlib.compress(json.dumps(month_rows).encode('utf-8'))
+            chunk_id = db.insert(
+                '''INSERT INTO delays_archive (month, first_delay_id, last_delay_id, row_count, payload)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (month, month_rows[0]['delay_id'], month_rows[-1]['delay_id'], len(month_rows), payload),
+                'chunk_id'
+            )
+            for row in month_rows:
+                db.execute(
+                    '''INSERT INTO delays_archive_index (delay_id, schedule_id, month, chunk_id, reported_at)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    (row['delay_id'], row['schedule_id'], month, chunk_id, row['reported_at'])
+                )
+        return len(archived)
+
+
+def archive_resolved_delays(storage, min_age_days, batch_size=1000, max_batches=10):
+    """Move resolved delays older than ``min_age_days`` into the archive
+
+    Work is split into short transactions of ``batch_size`` rows so the
+    hot table is never locked for long; at most ``max_batches`` run per call.
+    """
+    # One cutoff for the whole call, taken from the database clock
+    with storage.session() as db:
+        cutoff = _cutoff(db, storage.dialect, f'{min_age_days} days')
+    archived = 0
+    for _ in range(max_batches):
+        moved = _archive_batch(storage, cutoff, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+    return archived
+
+
+def find_archived_delays(db, delay_id=None, schedule_id=None):
+    """Look up archived delays by id or schedule through the archive index"""
+    if delay_id is not None:
+        entries = db.fetch_all('SELECT delay_id, chunk_id FROM delays_archive_index WHERE delay_id = ?', (delay_id,))
+    else:
+        entries = db.fetch_all('SELECT delay_id, chunk_id FROM delays_archive_index WHERE schedule_id = ?', (schedule_id,))
+
+    wanted = {}
+    for entry in entries:
+        wanted.setdefault(entry['chunk_id'], set()).add(entry['delay_id'])
+
+    delays = []
+    for chunk_id, delay_ids in wanted.items():
+        chunk = db.fetch_one('SELECT payload FROM delays_archive WHERE chunk_id = ?', (chunk_id,))
+        for row in json.loads(zlib.decompress(bytes(chunk['payload']))):
+            if row['delay_id'] in delay_ids:
+                row['archived'] = True
+                delays.append(row)
+    delays.sort(key=lambda row: str(row['reported_at']), reverse=True)
+    return delays
+
+# ============================================================================
+# BACKGROUND WORKER
+# ============================================================================
+
+class MaintenanceWorker:
+    """Runs delay maintenance periodically in a background thread
+
+    Resolve and archive run every ``interval`` seconds; vacuum/analyze
+    runs at most once a day, inside the off-peak UTC hour window
+    [``window_start``, ``window_end``). Across gunicorn workers only the
+    holder of an flock runs the loop. Every run, scheduled or manual, is
+    serialized by a second flock and, on PostgreSQL, an advisory lock
+    shared by all pods.
+    """
+
+    def __init__(self, storage, lock_dir, interval=3600, auto_resolve_hours=12,
+                 archive_after_days=30, batch_size=1000, vacuum_pages=1000,
+                 window_start=2, window_end=5):
+        self.storage = storage
+        self.lock_dir = lock_dir
+        self.interval = interval
+        self.auto_resolve_hours = auto_resolve_hours
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.window_start = window_start
+        self.window_end = window_end
+        self.last_run = None
+        self.last_vacuum_date = None
+        self._lock_file = None
+        self._thread = None
+
+    def in_window(self, now=None):
+        hour = (now or datetime.utcnow()).hour
+        if self.window_start <= self.window_end:
+            return self.window_start <= hour < self.window_end
+        return hour >= self.window_start or hour < self.window_end
+
+    @contextmanager
+    def _exclusive_run(self):
+        """Yield True if no other run is in progress on this pod or, on PostgreSQL, any pod"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, RUN_LOCK_NAME), 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            with self.storage.try_lock(MAINTENANCE_LOCK_KEY) as locked:
+                yield locked
+
+    def run_once(self, vacuum=None):
+        """Run every step once and return a report
+
+        ``vacuum`` forces (True) or skips (False) the vacuum step; by
+        default it runs once a day inside the off-peak window. Returns
+        None without doing anything if another run holds the lock.
+        """
+        with self._exclusive_run() as acquired:
+            if not acquired:
+                return None
+            started = time.perf_counter()
+            report = {
+                'resolved': resolve_stale_delays(self.storage, self.auto_resolve_hours),
+                'archived': archive_resolved_delays(self.storage, self.archive_after_days, self.batch_size),
+                'vacuumed': False,
+            }
+            today = datetime.utcnow().date()
+            if vacuum is None:
+                vacuum = self.in_window() and self.last_vacuum_date != today
+            if vacuum:
+                self.storage.vacuum(['delays', 'delays_archive_index'], pages=self.vacuum_pages)
+                self.last_vacuum_date = today
+                report['vacuumed'] = True
+            report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            report['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+            self.last_run = report
+            path = os.path.join(self.lock_dir, LAST_RUN_NAME)
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(report, f)
+            os.replace(f'{path}.tmp', path)
+            logger.info(f"Delay maintenance: {report}")
+            return report
+
+    def last_report(self):
+        """Report of the last run by any worker sharing ``lock_dir``, or None"""
+        try:
+            with open(os.path.join(self.lock_dir, LAST_RUN_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self.last_run
+
+    def _try_lock(self):
+        if self._lock_file is not None:
+            return True
+        f = open(os.path.join(self.lock_dir, LOCK_NAME), 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._try_lock():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Delay maintenance failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start the background thread (archive tables come from migrations.py)"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='delay-maintenance', daemon=True)
+        self._thread.start()
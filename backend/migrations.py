@@ -0,0 +1,336 @@
+"""
+Versioned schema migrations
+Run once per deployment (python migrations.py, or at import under
+gunicorn --preload) instead of once per worker
+"""
+
+import os
+import fcntl
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = '.migrations.lock'
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent pods migrate one at a time
+MIGRATION_LOCK_KEY = 72290030
+
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+Migration = namedtuple('Migration', ['version', 'name', 'ddl'])
+
+# ============================================================================
+# MIGRATIONS
+# ============================================================================
+# Append new migrations with the next version number; never edit one that
+# has shipped. Every statement must be safe on databases created before
+# versioning existed, hence IF NOT EXISTS throughout the baseline.
+
+MIGRATIONS = [
+    Migration(1, 'initial schema', {
+        'sqlite': """
+        CREATE TABLE IF NOT EXISTS routes (
+            route_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route_name VARCHAR(100) NOT NULL,
+            route_type VARCHAR(20) NOT NULL CHECK (route_type IN ('bus', 'train')),
+            operator VARCHAR(100),
+            start_station VARCHAR(100) NOT NULL,
+            end_station VARCHAR(100) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_routes_type ON routes(route_type);
+        CREATE INDEX IF NOT EXISTS idx_routes_operator ON routes(operator);
+
+        CREATE TABLE IF NOT EXISTS stations (
+            station_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station_name VARCHAR(100) NOT NULL UNIQUE,
+            station_type VARCHAR(20) CHECK (station_type IN ('bus_stop', 'train_station')),
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_stations_name ON stations(station_name);
+        CREATE INDEX IF NOT EXISTS idx_stations_type ON stations(station_type);
+
+        CREATE TABLE IF NOT EXISTS schedules (
+            schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+            departure_station_id INT NOT NULL REFERENCES stations(station_id),
+            arrival_station_id INT NOT NULL REFERENCES stations(station_id),
+            departure_time TIME NOT NULL,
+            arrival_time TIME NOT NULL,
+            day_of_week VARCHAR(20),
+            frequency INT DEFAULT 15,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CHECK (arrival_time > departure_time)
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedules_route ON schedules(route_id);
+        CREATE INDEX IF NOT EXISTS idx_schedules_day ON schedules(day_of_week);
+        CREATE INDEX IF NOT EXISTS idx_schedules_departure_station ON schedules(departure_station_id);
+        CREATE INDEX IF NOT EXISTS idx_schedules_arrival_station ON schedules(arrival_station_id);
+
+        CREATE TABLE IF NOT EXISTS delays (
+            delay_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schedule_id INT NOT NULL REFERENCES schedules(schedule_id) ON DELETE CASCADE,
+            delay_minutes INT NOT NULL DEFAULT 0,
+            reason TEXT,
+            reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            resolved_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CHECK (delay_minutes >= 0)
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_schedule ON delays(schedule_id);
+        CREATE INDEX IF NOT EXISTS idx_delays_active ON delays(is_active);
+        CREATE INDEX IF NOT EXISTS idx_delays_reported ON delays(reported_at);
+
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) NOT NULL UNIQUE,
+            email VARCHAR(100) NOT NULL UNIQUE,
+            password_hash VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+
+        CREATE TABLE IF NOT EXISTS user_favorites (
+            favorite_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, route_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_favorites_user ON user_favorites(user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_favorites_route ON user_favorites(route_id);
+        """,
+        # database/init.sql provisions the PostgreSQL schema and sample data
+        'postgresql': """
+        CREATE TABLE IF NOT EXISTS routes (
+            route_id SERIAL PRIMARY KEY,
+            route_name VARCHAR(100) NOT NULL,
+            route_type VARCHAR(20) NOT NULL CHECK (route_type IN ('bus', 'train')),
+            operator VARCHAR(100),
+            start_station VARCHAR(100) NOT NULL,
+            end_station VARCHAR(100) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_routes_type ON routes(route_type);
+        CREATE INDEX IF NOT EXISTS idx_routes_operator ON routes(operator);
+
+        CREATE TABLE IF NOT EXISTS stations (
+            station_id SERIAL PRIMARY KEY,
+            station_name VARCHAR(100) NOT NULL UNIQUE,
+            station_type VARCHAR(20) CHECK (station_type IN ('bus_stop', 'train_station')),
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_stations_name ON stations(station_name);
+        CREATE INDEX IF NOT EXISTS idx_stations_type ON stations(station_type);
+
+        CREATE TABLE IF NOT EXISTS schedules (
+            schedule_id SERIAL PRIMARY KEY,
+            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+            departure_station_id INT NOT NULL REFERENCES stations(station_id),
+            arrival_station_id INT NOT NULL REFERENCES stations(station_id),
+            departure_time TIME NOT NULL,
+            arrival_time TIME NOT NULL,
+            day_of_week VARCHAR(20),
+            frequency INT DEFAULT 15,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT check_times CHECK (arrival_time > departure_time)
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedules_route ON schedules(route_id);
+        CREATE INDEX IF NOT EXISTS idx_schedules_day ON schedules(day_of_week);
+        CREATE INDEX IF NOT EXISTS idx_schedules_departure_station ON schedules(departure_station_id);
+        CREATE INDEX IF NOT EXISTS idx_schedules_arrival_station ON schedules(arrival_station_id);
+
+        CREATE TABLE IF NOT EXISTS delays (
+            delay_id SERIAL PRIMARY KEY,
+            schedule_id INT NOT NULL REFERENCES schedules(schedule_id) ON DELETE CASCADE,
+            delay_minutes INT NOT NULL DEFAULT 0,
+            reason TEXT,
+            reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            resolved_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT check_delay_positive CHECK (delay_minutes >= 0)
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_schedule ON delays(schedule_id);
+        CREATE INDEX IF NOT EXISTS idx_delays_active ON delays(is_active);
+        CREATE INDEX IF NOT EXISTS idx_delays_reported ON delays(reported_at);
+
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            username VARCHAR(50) NOT NULL UNIQUE,
+            email VARCHAR(100) NOT NULL UNIQUE,
+            password_hash VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+
+        CREATE TABLE IF NOT EXISTS user_favorites (
+            favorite_id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, route_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_favorites_user ON user_favorites(user_id);
+        CREATE INDEX IF NOT EXISTS idx_favorites_route ON user_favorites(route_id);
+        """,
+    }),
+    # Archived delays live in compressed chunks, one chunk per month per batch.
+    # delays_archive_index maps every archived delay to its chunk for lookups.
+    Migration(2, 'delay archive', {
+        'sqlite': """
+        CREATE TABLE IF NOT EXISTS delays_archive (
+            chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            month VARCHAR(7) NOT NULL,
+            first_delay_id INT NOT NULL,
+            last_delay_id INT NOT NULL,
+            row_count INT NOT NULL,
+            payload BLOB NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_archive_month ON delays_archive(month);
+
+        CREATE TABLE IF NOT EXISTS delays_archive_index (
+            delay_id INTEGER PRIMARY KEY,
+            schedule_id INT NOT NULL,
+            month VARCHAR(7) NOT NULL,
+            chunk_id INT NOT NULL REFERENCES delays_archive(chunk_id) ON DELETE CASCADE,
+            reported_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_archive_index_schedule ON delays_archive_index(schedule_id);
+        """,
+        'postgresql': """
+        CREATE TABLE IF NOT EXISTS delays_archive (
+            chunk_id SERIAL PRIMARY KEY,
+            month VARCHAR(7) NOT NULL,
+            first_delay_id INT NOT NULL,
+            last_delay_id INT NOT NULL,
+            row_count INT NOT NULL,
+            payload BYTEA NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_archive_month ON delays_archive(month);
+
+        CREATE TABLE IF NOT EXISTS delays_archive_index (
+            delay_id INT PRIMARY KEY,
+            schedule_id INT NOT NULL,
+            month VARCHAR(7) NOT NULL,
+            chunk_id INT NOT NULL REFERENCES delays_archive(chunk_id) ON DELETE CASCADE,
+            reported_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_delays_archive_index_schedule ON delays_archive_index(schedule_id);
+        """,
+    }),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+@contextmanager
+def _file_lock(directory):
+    """Serialize migrations between processes sharing a SQLite file"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_NAME), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_version(storage):
+    """Highest applied migration version, or 0 for an unversioned database"""
+    try:
+        with storage.session() as db:
+            row = db.fetch_one('SELECT MAX(version) AS version FROM schema_migrations')
+    except Exception:
+        return 0
+    return (row and row['version']) or 0
+
+
+def _apply(db, dialect, migration):
+    record = (f"INSERT INTO schema_migrations (version, name) "
+              f"VALUES ({migration.version}, '{migration.name}');")
+    if dialect == 'sqlite':
+        # executescript runs in autocommit mode; make each migration atomic
+        db.run_script(f'BEGIN;\n{migration.ddl[dialect]}\n{record}\nCOMMIT;')
+    else:
+        db.run_script(f'{migration.ddl[dialect]}\n{record}')
+
+
+def _migrate(storage):
+    applied = []
+    with storage.session() as db:
+        if storage.dialect == 'postgresql':
+            # Held until the session commits, so all migrations are one transaction
+            db.fetch_one('SELECT pg_advisory_xact_lock(?) AS locked', (MIGRATION_LOCK_KEY,))
+        elif not db.fetch_one('SELECT COUNT(*) AS n FROM sqlite_master')['n']:
+            # Must be set before the first table exists
+            db.run_script('PRAGMA auto_vacuum = INCREMENTAL;')
+        db.run_script(SCHEMA_MIGRATIONS_DDL)
+        current = db.fetch_one('SELECT MAX(version) AS version FROM schema_migrations')['version'] or 0
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+            logger.info(f"Applying migration {migration.version}: {migration.name}")
+            _apply(db, storage.dialect, migration)
+            applied.append(migration.version)
+    return applied
+
+
+def migrate(storage):
+    """Apply pending migrations; returns the list of versions applied"""
+    if storage.dialect == 'sqlite':
+        with _file_lock(os.path.dirname(os.path.abspath(storage.path))):
+            applied = _migrate(storage)
+    else:
+        applied = _migrate(storage)
+    if applied:
+        logger.info(f"Schema migrated to version {LATEST_VERSION}")
+    else:
+        logger.info(f"Schema up to date (version {LATEST_VERSION})")
+    return applied
+
+
+if __name__ == '__main__':
+    # Deployment hook: python migrations.py
+    from config import config
+    from storage import create_storage
+
+    logging.basicConfig(level=logging.INFO)
+    cfg = config.get(os.getenv('FLASK_ENV', 'default'), config['default'])
+    storage = create_storage(cfg)
+    try:
+        migrate(storage)
+    finally:
+        storage.close()
@@ -0,0 +1,255 @@
+"""
+Request profiling for the Flask application
+Sampled phase timings plus on-demand cProfile / stack-sampling captures
+"""
+
+import io
+import hmac
+import sys
+import time
+import random
+import pstats
+import cProfile
+import threading
+from collections import Counter, deque
+
+from flask.json.provider import DefaultJSONProvider
+
+PHASES = ('connect', 'execute', 'fetch', 'serialize')
+CAPTURE_MODES = ('cprofile', 'sample')
+
+_local = threading.local()
+
+# -----------------------
+# Phase timing
+# -----------------------
+class _NullPhase:
+    """Shared no-op context manager used when the request is not sampled"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timings = self.recorder.timings
+        timings[self.name] = timings.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+def phase(name):
+    """Time a block as ``name`` if the current request is being profiled"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return _NULL_PHASE
+    return _Phase(recorder, name)
+
+
+class ProfiledJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that attributes encoding time to 'serialize'"""
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+# -----------------------
+# Stack sampler
+# -----------------------
+class StackSampler:
+    """Statistical profiler for one thread, in folded-stack format
+
+    A helper thread reads the target thread's frame every ``interval``
+    seconds; the result feeds flamegraph.pl or speedscope directly.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+# -----------------------
+# Per-request recorder
+# -----------------------
+class RequestRecorder:
+    """Timings (and optional capture) for one profiled request"""
+
+    def __init__(self, endpoint, mode=None, sample_interval=0.005):
+        self.endpoint = endpoint
+        self.mode = mode
+        self.timings = {}
+        self.profile = None
+        self.sampler = None
+        self.start = time.perf_counter()
+        if mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif mode == 'sample':
+            self.sampler = StackSampler(threading.get_ident(), sample_interval)
+            self.sampler.start()
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def server_timing(self):
+        """Render timings as a Server-Timing header value (milliseconds)"""
+        parts = [f'{name};dur={secs * 1000:.2f}' for name, secs in self.timings.items()]
+        parts.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(parts)
+
+# ============================================================================
+# PROFILER
+# ============================================================================
+
+class Profiler:
+    """Aggregates sampled request timings and stores on-demand captures
+
+    Statistics are per process; with several gunicorn workers each
+    admin call reports the worker that happened to serve it.
+    """
+
+    def __init__(self, sample_rate=0.0, admin_token=None, max_captures=20, sample_interval=0.005):
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token
+        self.sample_interval = sample_interval
+        self.captures = deque(maxlen=max_captures)
+        self.folded = Counter()
+        self.stats = {}
+        self._capture_seq = 0
+        self._lock = threading.Lock()
+
+    def is_admin(self, token):
+        """True if ``token`` matches the configured admin token"""
+        if not self.admin_token or token is None:
+            return False
+        return hmac.compare_digest(token.encode('utf-8'), self.admin_token.encode('utf-8'))
+
+    def begin(self, endpoint, capture_mode=None):
+        """Start recording the current request if it is sampled or captured"""
+        if capture_mode not in CAPTURE_MODES:
+            capture_mode = None
+            if not self.sample_rate or random.random() >= self.sample_rate:
+                return None
+        recorder = RequestRecorder(endpoint, capture_mode, self.sample_interval)
+        _local.recorder = recorder
+        return recorder
+
+    def end(self):
+        """Finish the current recorder; returns it, or None if not profiled"""
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return None
+        _local.recorder = None
+        recorder.finish()
+        with self._lock:
+            entry = self.stats.setdefault(recorder.endpoint, {'count': 0, 'phases': {}})
+            entry['count'] += 1
+            for name, secs in list(recorder.timings.items()) + [('total', recorder.total)]:
+                agg = entry['phases'].setdefault(name, {'sum': 0.0, 'max': 0.0})
+                agg['sum'] += secs
+                agg['max'] = max(agg['max'], secs)
+            if recorder.mode is not None:
+                self._capture_seq += 1
+                recorder.capture_id = self._capture_seq
+                self.captures.append(self._capture_record(recorder))
+                if recorder.sampler is not None:
+                    self.folded.update(recorder.sampler.stacks)
+        return recorder
+
+    def discard(self):
+        """Drop the current recorder without recording it (request errored)"""
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is not None:
+            _local.recorder = None
+            recorder.finish()
+
+    def _capture_record(self, recorder):
+        record = {
+            'id': recorder.capture_id,
+            'endpoint': recorder.endpoint,
+            'mode': recorder.mode,
+            'total_ms': round(recorder.total * 1000, 2),
+            'captured_at': time.time(),
+        }
+        if recorder.profile is not None:
+            out = io.StringIO()
+            pstats.Stats(recorder.profile, stream=out).sort_stats('cumulative').print_stats(40)
+            record['output'] = out.getvalue()
+        else:
+            record['output'] = folded_text(recorder.sampler.stacks)
+        return record
+
+    def summary(self):
+        """Aggregated phase timings per endpoint, in milliseconds"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, entry in self.stats.items():
+                count = entry['count']
+                endpoints[endpoint] = {
+                    'count': count,
+                    'phases': {
+                        name: {'avg_ms': round(agg['sum'] / count * 1000, 3),
+                               'max_ms': round(agg['max'] * 1000, 3)}
+                        for name, agg in entry['phases'].items()
+                    }
+                }
+            captures = [{k: v for k, v in c.items() if k != 'output'} for c in self.captures]
+        return {'sample_rate': self.sample_rate, 'endpoints': endpoints, 'captures': captures}
+
+    def capture(self, capture_id):
+        """Return a stored capture by id, or None"""
+        with self._lock:
+            for record in self.captures:
+                if record['id'] == capture_id:
+                    return record
+        return None
+
+    def flamegraph(self):
+        """All sampled stacks so far, in folded-stack format"""
+        with self._lock:
+            return folded_text(self.folded)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.captures.clear()
+            self.folded.clear()
+
+
+def folded_text(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
@@ -0,0 +1,235 @@
+"""
+SQLite snapshot replication
+The primary publishes consistent snapshots to a shared directory;
+read-only replicas swap in the newest one and forward writes to the primary
+"""
+
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+from storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'LATEST.json'
+LOCK_NAME = '.publisher.lock'
+SNAPSHOT_PREFIX = 'snapshot-'
+SNAPSHOT_SUFFIX = '.sqlite'
+
+
+def read_manifest(snapshot_dir):
+    """Return the published manifest, or None if nothing is published yet"""
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# ============================================================================
+# PRIMARY - SNAPSHOT PUBLISHER
+# ============================================================================
+
+class SnapshotPublisher:
+    """Periodically copies the primary database into the snapshot directory
+
+    Snapshots are taken with the SQLite online backup API, so they are
+    transactionally consistent while the primary keeps serving writes.
+    The primary runs in WAL mode, so the copy only holds a read snapshot
+    and never blocks writers. When nothing was committed since the last
+    snapshot, the manifest's ``verified_at`` is bumped instead of copying.
+    Only one process per snapshot directory publishes at a time; gunicorn
+    workers compete for an flock and the others stay idle.
+    """
+
+    def __init__(self, db_path, snapshot_dir, interval=30, keep=3):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.interval = interval
+        self.keep = max(keep, 2)
+        self._src = None
+        self._data_version = None
+        self._lock_file = None
+        self._thread = None
+
+    def _source(self):
+        # Kept open: PRAGMA data_version only tracks commits made by other
+        # connections since this one last asked
+        if self._src is None:
+            self._src = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._src.execute('PRAGMA journal_mode=WAL')
+        return self._src
+
+    def publish(self, force=False):
+        """Take one snapshot and point the manifest at it
+
+        Without ``force``, an unchanged database only refreshes the
+        manifest's ``verified_at``.
+        """
+        src = self._source()
+        data_version = src.execute('PRAGMA data_version').fetchone()[0]
+        manifest = read_manifest(self.snapshot_dir) or {}
+        if not force and manifest and data_version == self._data_version:
+            manifest['verified_at'] = time.time()
+            _write_atomic(os.path.join(self.snapshot_dir, MANIFEST_NAME), json.dumps(manifest))
+            return manifest
+
+        generation = manifest.get('generation', 0) + 1
+        name = f'{SNAPSHOT_PREFIX}{generation:010d}{SNAPSHOT_SUFFIX}'
+        path = os.path.join(self.snapshot_dir, name)
+        tmp = f'{path}.tmp'
+
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            # Replicas open snapshots immutable; give them a self-contained file
+            dst.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            dst.close()
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._data_version = data_version
+
+        created_at = time.time()
+        manifest = {'file': name, 'generation': generation,
+                    'created_at': created_at, 'verified_at': created_at}
+        _write_atomic(os.path.join(self.snapshot_dir, MANIFEST_NAME), json.dumps(manifest))
+        self._prune()
+        logger.info(f"Published snapshot {name}")
+        return manifest
+
+    def _prune(self):
+        names = os.listdir(self.snapshot_dir)
+        snapshots = sorted(
+            f for f in names if f.startswith(SNAPSHOT_PREFIX) and f.endswith(SNAPSHOT_SUFFIX)
+        )
+        # Only the flock holder publishes, so any .tmp left is from a failed publish
+        leftovers = [f for f in names if f.startswith(SNAPSHOT_PREFIX) and f.endswith(f'{SNAPSHOT_SUFFIX}.tmp')]
+        for name in snapshots[:-self.keep] + leftovers:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _try_lock(self):
+        if self._lock_file is not None:
+            return True
+        f = open(os.path.join(self.snapshot_dir, LOCK_NAME), 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._lock_file = f
+        logger.info(f"Snapshot publisher active (pid {os.getpid()})")
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._try_lock():
+                    self.publish()
+            except Exception as e:
+                logger.error(f"Snapshot publish failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start the background publishing thread"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='snapshot-publisher', daemon=True)
+        self._thread.start()
+
+# ============================================================================
+# REPLICA - READ-ONLY STORAGE
+# ============================================================================
+
+class ReplicaStorage(SQLiteStorage):
+    """Read-only SQLite backend serving the newest published snapshot
+
+    Snapshots never change once published, so connections are opened
+    with ``immutable=1`` and skip file locking entirely. ``refresh``
+    swaps the path to a newer snapshot; sessions already open keep
+    reading the file they started on.
+    """
+
+    name = 'sqlite-replica'
+    read_only = True
+
+    def __init__(self, snapshot_dir, poll_interval=2, batch_size=500):
+        super().__init__(None, batch_size=batch_size)
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self.generation = None
+        self.snapshot_created_at = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Swap in the newest snapshot; returns True if one is in use"""
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return self.path is not None
+        with self._lock:
+            self._next_poll = now + self.poll_interval
+            manifest = read_manifest(self.snapshot_dir)
+            if manifest and manifest['generation'] != self.generation:
+                self.path = os.path.join(self.snapshot_dir, manifest['file'])
+                self.generation = manifest['generation']
+                logger.info(f"Serving snapshot generation {self.generation}")
+            if manifest and manifest['generation'] == self.generation:
+                # The primary re-verifies an unchanged snapshot instead of copying it
+                self.snapshot_created_at = manifest.get('verified_at', manifest['created_at'])
+        return self.path is not None
+
+    def staleness(self):
+        """Seconds since the primary last confirmed the snapshot in use, or None"""
+        if self.snapshot_created_at is None:
+            return None
+        return max(0.0, time.time() - self.snapshot_created_at)
+
+    def connect(self):
+        if self.path is None:
+            raise sqlite3.OperationalError('No snapshot available yet')
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro&immutable=1', uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+# ============================================================================
+# WRITE FORWARDING
+# ============================================================================
+
+FORWARDED_HEADERS = ('Content-Type', 'Accept', 'Authorization')
+
+
+def forward_to_primary(primary_url, req, timeout=10):
+    """Replay a Flask request against the primary and return its response
+
+    Returns a ``(body, status, headers)`` tuple usable as a Flask response.
+    Raises urllib.error.URLError if the primary is unreachable.
+    """
+    headers = {h: req.headers[h] for h in FORWARDED_HEADERS if h in req.headers}
+    url = primary_url.rstrip('/') + req.full_path.rstrip('?')
+    upstream = urllib.request.Request(url, data=req.get_data(), headers=headers, method=req.method)
+    try:
+        with urllib.request.urlopen(upstream, timeout=timeout) as resp:
+            return resp.read(), resp.status, {'Content-Type': resp.headers.get('Content-Type', 'application/json')}
+    except urllib.error.HTTPError as e:
+        return e.read(), e.code, {'Content-Type': e.headers.get('Content-Type', 'application/json')}
@@ -0,0 +1,463 @@
+"""
+Storage layer for the Flask application
+One interface implemented by the SQLite and PostgreSQL backends
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date, time
+from decimal import Decimal
+
+from profiling import phase
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# STORAGE INTERFACE
+# ============================================================================
+
+class StorageSession:
+    """A unit of work on one database connection
+
+    SQL is written once with ``?`` placeholders; each backend translates
+    it to its own parameter style.
+    """
+
+    def fetch_all(self, sql, params=()):
+        """Run a query and return every row as a dict"""
+        raise NotImplementedError
+
+    def fetch_one(self, sql, params=()):
+        """Run a query and return the first row as a dict, or None"""
+        raise NotImplementedError
+
+    def iter_rows(self, sql, params=()):
+        """Stream rows as dicts for result sets too large to hold in memory
+
+        On PostgreSQL this costs extra DECLARE/FETCH/CLOSE round trips;
+        use fetch_all for anything the caller materializes anyway.
+        """
+        raise NotImplementedError
+
+    def execute(self, sql, params=()):
+        """Run a statement and return the number of affected rows"""
+        raise NotImplementedError
+
+    def insert(self, sql, params, pk):
+        """Run an INSERT and return the generated primary key ``pk``"""
+        raise NotImplementedError
+
+    def run_script(self, sql):
+        """Run one or more parameterless statements as-is (DDL)"""
+        raise NotImplementedError
+
+
+class Storage:
+    """Base class for storage backends"""
+
+    name = None
+    dialect = None
+    read_only = False
+
+    @contextmanager
+    def session(self):
+        """Yield a StorageSession; commit on success, roll back on error"""
+        raise NotImplementedError
+        yield
+
+    def vacuum(self, tables, pages=None):
+        """Reclaim free space and refresh planner statistics for ``tables``
+
+        ``pages`` bounds the work for backends with incremental vacuum.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def try_lock(self, key):
+        """Yield True if this process now holds the cross-host lock ``key``
+
+        Backends living on one host rely on file locks and always yield True.
+        """
+        yield True
+
+    def ping(self):
+        """Raise if the database is unreachable"""
+        with self.session() as db:
+            db.fetch_one('SELECT 1 AS ok')
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+# ============================================================================
+# SQLITE BACKEND
+# ============================================================================
+
+class SQLiteSession(StorageSession):
+    """StorageSession over a sqlite3 connection"""
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+
+    def _execute(self, sql, params):
+        with phase('execute'):
+            return self.conn.execute(sql, params)
+
+    def fetch_all(self, sql, params=()):
+        cur = self._execute(sql, params)
+        with phase('fetch'):
+            return [dict(row) for row in cur.fetchall()]
+
+    def fetch_one(self, sql, params=()):
+        cur = self._execute(sql, params)
+        with phase('fetch'):
+            row = cur.fetchone()
+            return dict(row) if row is not None else None
+
+    def iter_rows(self, sql, params=()):
+        cur = self._execute(sql, params)
+        while True:
+            with phase('fetch'):
+                rows = [dict(row) for row in cur.fetchmany(self.batch_size)]
+            if not rows:
+                break
+            yield from rows
+
+    def execute(self, sql, params=()):
+        return self._execute(sql, params).rowcount
+
+    def insert(self, sql, params, pk):
+        return self._execute(sql, params).lastrowid
+
+    def run_script(self, sql):
+        self.conn.executescript(sql)
+
+
+class SQLiteStorage(Storage):
+    """SQLite backend - one short-lived connection per session"""
+
+    name = 'sqlite'
+    dialect = 'sqlite'
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+
+    def connect(self):
+        """Open a raw sqlite3 connection to the database file"""
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"Database connection error: {e}")
+            raise
+
+    @contextmanager
+    def session(self):
+        with phase('connect'):
+            conn = self.connect()
+        try:
+            yield SQLiteSession(conn, self.batch_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def vacuum(self, tables, pages=None):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # One-time full rebuild to switch the file to incremental mode
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                conn.execute(f'PRAGMA incremental_vacuum({int(pages or 0)})').fetchall()
+            for table in tables:
+                conn.execute(f'ANALYZE {table}')
+        finally:
+            conn.close()
+
+# ============================================================================
+# POSTGRESQL BACKEND
+# ============================================================================
+
+def _to_json_value(value):
+    """Render PostgreSQL-native types the way SQLite returns them"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _row_to_dict(row):
+    return {key: _to_json_value(value) for key, value in row.items()}
+
+
+def _rewrite_placeholders(sql, placeholder, escape_percent=False):
+    """Rewrite ``?`` placeholders outside quoted literals and identifiers
+
+    ``placeholder(n)`` renders the n-th (1-based) parameter. With
+    ``escape_percent`` every ``%`` is doubled, as psycopg2 requires when
+    parameters are passed. Returns ``(sql, parameter_count)``.
+    """
+    out = []
+    count = 0
+    quote = None
+    for ch in sql:
+        if quote is not None:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == '?':
+            count += 1
+            out.append(placeholder(count))
+            continue
+        out.append('%%' if escape_percent and ch == '%' else ch)
+    return ''.join(out), count
+
+
+def _numbered_placeholders(sql):
+    """Rewrite ``?`` placeholders as ``$1, $2, ...`` for PREPARE"""
+    return _rewrite_placeholders(sql, lambda n: f'${n}')
+
+
+def _pyformat_placeholders(sql):
+    """Rewrite ``?`` placeholders as ``%s`` for a psycopg2 cursor"""
+    return _rewrite_placeholders(sql, lambda n: '%s', escape_percent=True)[0]
+
+
+class PostgresSession(StorageSession):
+    """StorageSession over a pooled psycopg2 connection
+
+    Point queries run as server-side prepared statements, cached per
+    connection, so repeated requests skip parse and plan. ``iter_rows``
+    uses a named (server-side) cursor so large reads arrive in batches
+    instead of being buffered whole by libpq.
+    """
+
+    def __init__(self, conn, batch_size, cursor_factory, stale_plan_error, idle_status):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.cursor_factory = cursor_factory
+        self.stale_plan_error = stale_plan_error
+        self.idle_status = idle_status
+
+    def _prepared(self, cur, sql):
+        prepared = self.conn.prepared
+        entry = prepared.get(sql)
+        if entry is None:
+            name = f'stmt_{len(prepared)}'
+            numbered, nparams = _numbered_placeholders(sql)
+            cur.execute(f'PREPARE {name} AS {numbered}')
+            entry = prepared[sql] = (name, nparams)
+        return entry
+
+    def _run_prepared(self, sql, params):
+        cur = self.conn.cursor(cursor_factory=self.cursor_factory)
+        name, nparams = self._prepared(cur, sql)
+        if nparams:
+            placeholders = ', '.join(['%s'] * nparams)
+            cur.execute(f'EXECUTE {name} ({placeholders})', tuple(params))
+        else:
+            cur.execute(f'EXECUTE {name}')
+        return cur
+
+    def _reset_prepared(self):
+        self.conn.rollback()
+        with self.conn.cursor() as cur:
+            cur.execute('DEALLOCATE ALL')
+        self.conn.prepared.clear()
+
+    def _execute(self, sql, params):
+        with phase('execute'):
+            first_statement = self.conn.info.transaction_status == self.idle_status
+            try:
+                return self._run_prepared(sql, params)
+            except self.stale_plan_error as e:
+                # A migration altered a table behind a cached statement
+                # ("cached plan must not change result type"): drop every
+                # cached statement, then retry if no earlier work is lost
+                if 'cached plan' not in str(e):
+                    raise
+                self._reset_prepared()
+                if not first_statement:
+                    raise
+                return self._run_prepared(sql, params)
+
+    def fetch_all(self, sql, params=()):
+        cur = self._execute(sql, params)
+        with phase('fetch'):
+            rows = [_row_to_dict(row) for row in cur.fetchall()]
+        cur.close()
+        return rows
+
+    def fetch_one(self, sql, params=()):
+        cur = self._execute(sql, params)
+        with phase('fetch'):
+            row = cur.fetchone()
+        cur.close()
+        return _row_to_dict(row) if row is not None else None
+
+    def iter_rows(self, sql, params=()):
+        self.conn.cursor_seq += 1
+        cur = self.conn.cursor(name=f'stream_{self.conn.cursor_seq}',
+                               cursor_factory=self.cursor_factory)
+        try:
+            with phase('execute'):
+                cur.execute(_pyformat_placeholders(sql), tuple(params))
+            while True:
+                with phase('fetch'):
+                    rows = [_row_to_dict(row) for row in cur.fetchmany(self.batch_size)]
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+    def execute(self, sql, params=()):
+        cur = self._execute(sql, params)
+        count = cur.rowcount
+        cur.close()
+        return count
+
+    def insert(self, sql, params, pk):
+        cur = self._execute(f'{sql} RETURNING {pk}', params)
+        new_id = cur.fetchone()[pk]
+        cur.close()
+        return new_id
+
+    def run_script(self, sql):
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL backend backed by a thread-safe connection pool"""
+
+    name = 'postgresql'
+    dialect = 'postgresql'
+
+    def __init__(self, host, port, dbname, user, password,
+                 minconn=1, maxconn=10, batch_size=500):
+        # psycopg2 is only required when this backend is selected
+        import psycopg2
+        from psycopg2 import errors, extensions, extras, pool
+
+        class PooledConnection(extensions.connection):
+            """Connection that remembers its prepared statements"""
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.prepared = {}
+                self.cursor_seq = 0
+
+        self._errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+        self._cursor_factory = extras.RealDictCursor
+        self._stale_plan_error = errors.FeatureNotSupported
+        self._idle_status = extensions.TRANSACTION_STATUS_IDLE
+        self.batch_size = batch_size
+        self._make_pool = lambda: pool.ThreadedConnectionPool(
+            minconn, maxconn,
+            host=host, port=port, dbname=dbname, user=user, password=password,
+            connection_factory=PooledConnection,
+        )
+        self._describe = f"{minconn}-{maxconn} connections to {host}:{port}/{dbname}"
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # Connections must not cross a fork (gunicorn --preload), and the
+        # arbiter closes its pool before forking; open one per process lazily
+        if self._pool is None or self._pool.closed or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool.closed or self._pool_pid != os.getpid():
+                    self._pool = self._make_pool()
+                    self._pool_pid = os.getpid()
+                    logger.info(f"PostgreSQL pool ready ({self._describe}, pid {self._pool_pid})")
+        return self._pool
+
+    @contextmanager
+    def session(self):
+        pg_pool = self._get_pool()
+        with phase('connect'):
+            conn = pg_pool.getconn()
+        broken = False
+        try:
+            yield PostgresSession(conn, self.batch_size, self._cursor_factory,
+                                  self._stale_plan_error, self._idle_status)
+            conn.commit()
+        except Exception as e:
+            broken = isinstance(e, self._errors) or conn.closed
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pg_pool.putconn(conn, close=broken)
+
+    def vacuum(self, tables, pages=None):
+        # VACUUM cannot run inside a transaction block
+        pg_pool = self._get_pool()
+        conn = pg_pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for table in tables:
+                    cur.execute(f'VACUUM (ANALYZE) {table}')
+        finally:
+            conn.autocommit = False
+            pg_pool.putconn(conn)
+
+    @contextmanager
+    def try_lock(self, key):
+        # Session-level advisory lock on its own autocommit connection, so no
+        # transaction stays open while the caller works in other sessions
+        pg_pool = self._get_pool()
+        conn = pg_pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_try_advisory_lock(%s)', (key,))
+                locked = cur.fetchone()[0]
+            try:
+                yield locked
+            finally:
+                if locked:
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT pg_advisory_unlock(%s)', (key,))
+        finally:
+            conn.autocommit = False
+            pg_pool.putconn(conn)
+
+    def close(self):
+        # Only the process that opened the pool may close its sockets
+        if self._pool is not None and not self._pool.closed and self._pool_pid == os.getpid():
+            self._pool.closeall()
+
+# ============================================================================
+# BACKEND SELECTION
+# ============================================================================
+
+def create_storage(cfg):
+    """Build the storage backend selected by ``cfg.DB_TYPE``"""
+    db_type = cfg.DB_TYPE.lower()
+    if db_type == 'sqlite' and cfg.SQLITE_ROLE == 'replica':
+        from replication import ReplicaStorage
+        return ReplicaStorage(cfg.SNAPSHOT_DIR, poll_interval=cfg.SNAPSHOT_POLL_INTERVAL,
+                              batch_size=cfg.DB_STREAM_BATCH_SIZE)
+    if db_type == 'sqlite':
+        return SQLiteStorage(cfg.SQLITE_PATH, batch_size=cfg.DB_STREAM_BATCH_SIZE)
+    if db_type in ('postgres', 'postgresql'):
+        return PostgresStorage(
+            cfg.DB_HOST, cfg.DB_PORT, cfg.DB_NAME, cfg.DB_USER, cfg.DB_PASSWORD,
+            minconn=cfg.DB_POOL_MIN, maxconn=cfg.DB_POOL_MAX,
+            batch_size=cfg.DB_STREAM_BATCH_SIZE,
+        )
+    raise ValueError(f"Unsupported DB_TYPE: {cfg.DB_TYPE}")
@@ -0,0 +1,56 @@
+"""
+Startup warm-up
+Primes the OS page cache and each worker's connections before traffic
+"""
+
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hot read endpoints replayed once per worker
+WARMUP_PATHS = ('/api/routes', '/api/stations', '/api/schedules', '/api/delays')
+
+# Marks replayed requests so request profiling leaves them out
+WARMUP_HEADER = 'X-Warmup'
+
+READ_CHUNK = 1024 * 1024
+
+
+def warm_page_cache(path, max_bytes):
+    """Read a SQLite file (and its WAL) so the OS page cache holds it
+
+    The page cache is shared by every process on the node, so under
+    gunicorn --preload this runs once in the arbiter for all workers.
+    Returns the number of bytes read.
+    """
+    total = 0
+    for name in (path, f'{path}-wal'):
+        if not name or not os.path.exists(name):
+            continue
+        with open(name, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while total < max_bytes:
+                chunk = f.read(min(READ_CHUNK, max_bytes - total))
+                if not chunk:
+                    break
+                total += len(chunk)
+    return total
+
+
+def warm_requests(app, paths=WARMUP_PATHS):
+    """Replay hot GET endpoints in-process
+
+    Opens this worker's database connections, fills the PostgreSQL
+    prepared-statement cache and loads every lazily imported code path
+    before the first real request arrives.
+    """
+    started = time.perf_counter()
+    client = app.test_client()
+    for path in paths:
+        response = client.get(path, headers={WARMUP_HEADER: '1'})
+        if response.status_code >= 500:
+            logger.warning(f"Warm-up request {path} returned {response.status_code}")
+    return time.perf_counter() - started
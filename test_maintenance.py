@@ -0,0 +1,126 @@
+"""
+Delay maintenance tests
+Runs resolve -> archive -> lookup against a temporary SQLite database:
+
+    python -m pytest -q test_maintenance.py
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+# app.py builds its storage at import time; point it at a scratch file
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'transport_db.sqlite'))
+
+import app as app_module
+from storage import SQLiteStorage
+from migrations import migrate
+from maintenance import (MaintenanceWorker, resolve_stale_delays, archive_resolved_delays,
+                         find_archived_delays)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / 'transport_db.sqlite'))
+    migrate(storage)
+    with storage.session() as db:
+        route_id = db.insert(
+            '''INSERT INTO routes (route_name, route_type, operator, start_station, end_station)
+               VALUES (?, ?, ?, ?, ?)''',
+            ('R1', 'bus', 'Metro', 'A', 'B'), 'route_id')
+        a = db.insert('INSERT INTO stations (station_name) VALUES (?)', ('A',), 'station_id')
+        b = db.insert('INSERT INTO stations (station_name) VALUES (?)', ('B',), 'station_id')
+        db.insert(
+            '''INSERT INTO schedules (route_id, departure_station_id, arrival_station_id,
+                                      departure_time, arrival_time)
+               VALUES (?, ?, ?, ?, ?)''',
+            (route_id, a, b, '08:00', '09:00'), 'schedule_id')
+    monkeypatch.setattr(app_module, 'storage', storage)
+    return storage
+
+
+def _add_delay(db, reported_at, is_active=True, resolved_at=None):
+    return db.insert(
+        '''INSERT INTO delays (schedule_id, delay_minutes, reported_at, is_active, resolved_at)
+           VALUES (?, ?, ?, ?, ?)''',
+        (1, 5, reported_at, is_active, resolved_at), 'delay_id')
+
+
+def _delay_ids(db):
+    return [row['delay_id'] for row in db.fetch_all('SELECT delay_id FROM delays ORDER BY delay_id')]
+
+
+def test_resolve_only_stale_active_delays(storage):
+    with storage.session() as db:
+        stale = _add_delay(db, '2020-01-01 08:00:00')
+        fresh = db.insert('INSERT INTO delays (schedule_id, delay_minutes) VALUES (?, ?)', (1, 3), 'delay_id')
+    assert resolve_stale_delays(storage, 12) == 1
+    with storage.session() as db:
+        rows = {row['delay_id']: row for row in
+                db.fetch_all('SELECT delay_id, is_active, resolved_at FROM delays')}
+    assert not rows[stale]['is_active'] and rows[stale]['resolved_at'] is not None
+    assert rows[fresh]['is_active'] and rows[fresh]['resolved_at'] is None
+
+
+def test_archive_moves_old_resolved_delays(storage):
+    with storage.session() as db:
+        old = [_add_delay(db, f'2020-0{month}-01 08:00:00', False, f'2020-0{month}-01 10:00:00')
+               for month in (1, 1, 2)]
+        recent = _add_delay(db, '2020-03-01 08:00:00', False)
+        db.execute('UPDATE delays SET resolved_at = CURRENT_TIMESTAMP WHERE delay_id = ?', (recent,))
+        active = _add_delay(db, '2020-03-01 08:00:00')
+
+    assert archive_resolved_delays(storage, 30, batch_size=2) == 3
+    assert archive_resolved_delays(storage, 30, batch_size=2) == 0
+
+    with storage.session() as db:
+        assert _delay_ids(db) == [recent, active]
+        chunks = db.fetch_all('SELECT month, row_count FROM delays_archive ORDER BY chunk_id')
+        assert chunks == [{'month': '2020-01', 'row_count': 2}, {'month': '2020-02', 'row_count': 1}]
+        archived = find_archived_delays(db, schedule_id=1)
+    assert sorted(row['delay_id'] for row in archived) == old
+    assert all(row['archived'] for row in archived)
+
+
+def test_reactivated_delay_is_not_archived(storage):
+    with storage.session() as db:
+        delay_id = _add_delay(db, '2020-01-01 08:00:00', False, '2020-01-01 10:00:00')
+    client = app_module.app.test_client()
+    assert client.put(f'/api/delays/{delay_id}', json={'is_active': True}).status_code == 200
+    assert archive_resolved_delays(storage, 30) == 0
+    with storage.session() as db:
+        assert _delay_ids(db) == [delay_id]
+        assert db.fetch_all('SELECT delay_id FROM delays_archive_index') == []
+
+
+def test_archived_delay_served_by_api(storage):
+    with storage.session() as db:
+        delay_id = _add_delay(db, '2020-01-01 08:00:00', False, '2020-01-01 10:00:00')
+    archive_resolved_delays(storage, 30)
+
+    client = app_module.app.test_client()
+    delay = client.get(f'/api/delays/{delay_id}').get_json()['data']
+    assert delay['archived'] and delay['route_name'] == 'R1'
+    assert client.get('/api/delays/999').status_code == 404
+
+    history = client.get('/api/schedules/1/delays?include_archived=true').get_json()['data']
+    assert [row['delay_id'] for row in history] == [delay_id]
+    assert client.get('/api/schedules/1/delays').get_json()['data'] == []
+
+
+def test_run_once_reports_and_skips_when_locked(storage, tmp_path):
+    with storage.session() as db:
+        _add_delay(db, '2020-01-01 08:00:00')
+    worker = MaintenanceWorker(storage, str(tmp_path))
+    first = MaintenanceWorker(storage, str(tmp_path))
+    with first._exclusive_run() as acquired:
+        assert acquired
+        assert worker.run_once(vacuum=False) is None
+
+    report = worker.run_once(vacuum=True)
+    assert (report['resolved'], report['vacuumed']) == (1, True)
+    assert first.last_report() == report
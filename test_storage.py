@@ -0,0 +1,166 @@
+"""
+Storage backend tests
+Runs every StorageSession method against SQLite, and against PostgreSQL
+when TEST_DB_HOST points at a server (uses the transport_db_test database):
+
+    TEST_DB_HOST=localhost python -m pytest -q test_storage.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from storage import SQLiteStorage, PostgresStorage, _numbered_placeholders, _pyformat_placeholders
+from migrations import migrate
+
+
+# -----------------------
+# Placeholder rewriting
+# -----------------------
+def test_numbered_placeholders():
+    assert _numbered_placeholders('SELECT * FROM t WHERE a = ? AND b = ?') == \
+        ('SELECT * FROM t WHERE a = $1 AND b = $2', 2)
+
+
+def test_numbered_placeholders_skip_literals():
+    sql = "SELECT '?' AS q, \"col?\" FROM t WHERE a = ? AND b = 'it''s ?'"
+    assert _numbered_placeholders(sql) == \
+        ("SELECT '?' AS q, \"col?\" FROM t WHERE a = $1 AND b = 'it''s ?'", 1)
+
+
+def test_pyformat_placeholders_escape_percent():
+    assert _pyformat_placeholders("SELECT * FROM t WHERE a LIKE '5%' AND b = ?") == \
+        "SELECT * FROM t WHERE a LIKE '5%%' AND b = %s"
+
+
+# -----------------------
+# Backends
+# -----------------------
+def _sqlite_storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / 'transport_db.sqlite'), batch_size=2)
+
+
+def _postgres_storage(tmp_path):
+    if not os.getenv('TEST_DB_HOST'):
+        pytest.skip('TEST_DB_HOST not set')
+    pytest.importorskip('psycopg2')
+    storage = PostgresStorage(
+        os.getenv('TEST_DB_HOST'), os.getenv('TEST_DB_PORT', '5432'),
+        os.getenv('TEST_DB_NAME', 'transport_db_test'),
+        os.getenv('TEST_DB_USER', 'postgres'), os.getenv('TEST_DB_PASSWORD', 'postgres'),
+        minconn=1, maxconn=2, batch_size=2,
+    )
+    with storage.session() as db:
+        db.run_script('TRUNCATE routes RESTART IDENTITY CASCADE;')
+    return storage
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def storage(request, tmp_path):
+    factory = _sqlite_storage if request.param == 'sqlite' else _postgres_storage
+    storage = factory(tmp_path)
+    migrate(storage)
+    yield storage
+    storage.close()
+
+
+def _add_route(db, name, operator='Metro'):
+    return db.insert(
+        '''INSERT INTO routes (route_name, route_type, operator, start_station, end_station)
+           VALUES (?, ?, ?, ?, ?)''',
+        (name, 'bus', operator, 'A', 'B'),
+        'route_id'
+    )
+
+
+def test_insert_returns_primary_key(storage):
+    with storage.session() as db:
+        first = _add_route(db, 'R1')
+        second = _add_route(db, 'R2')
+    assert second == first + 1
+
+
+def test_fetch_one_and_fetch_all(storage):
+    with storage.session() as db:
+        route_id = _add_route(db, 'R1')
+        _add_route(db, 'R2')
+        route = db.fetch_one('SELECT route_id, route_name FROM routes WHERE route_id = ?', (route_id,))
+        missing = db.fetch_one('SELECT route_id FROM routes WHERE route_id = ?', (-1,))
+        routes = db.fetch_all('SELECT route_name FROM routes ORDER BY route_id')
+    assert route == {'route_id': route_id, 'route_name': 'R1'}
+    assert missing is None
+    assert routes == [{'route_name': 'R1'}, {'route_name': 'R2'}]
+
+
+def test_prepared_statement_reused(storage):
+    sql = 'SELECT route_name FROM routes WHERE route_id = ?'
+    with storage.session() as db:
+        ids = [_add_route(db, f'R{i}') for i in range(3)]
+        prepared_before = len(getattr(db.conn, 'prepared', {}))
+        names = [db.fetch_one(sql, (route_id,))['route_name'] for route_id in ids]
+        if storage.dialect == 'postgresql':
+            assert len(db.conn.prepared) == prepared_before + 1
+    assert names == ['R0', 'R1', 'R2']
+
+
+def test_stale_prepared_statement_recovers(storage):
+    if storage.dialect != 'postgresql':
+        pytest.skip('prepared statements are PostgreSQL only')
+    sql = 'SELECT * FROM routes WHERE route_id = ?'
+    with storage.session() as db:
+        route_id = _add_route(db, 'R1')
+        db.fetch_one(sql, (route_id,))
+    with storage.session() as db:
+        db.run_script('ALTER TABLE routes ADD COLUMN scratch INT;')
+    try:
+        with storage.session() as db:
+            assert db.fetch_one(sql, (route_id,))['scratch'] is None
+    finally:
+        with storage.session() as db:
+            db.run_script('ALTER TABLE routes DROP COLUMN scratch;')
+
+
+def test_iter_rows_streams_in_batches(storage):
+    with storage.session() as db:
+        for i in range(5):
+            _add_route(db, f'R{i}')
+        rows = list(db.iter_rows(
+            "SELECT route_name FROM routes WHERE operator LIKE ? ORDER BY route_id", ('Met%',)))
+    assert [row['route_name'] for row in rows] == ['R0', 'R1', 'R2', 'R3', 'R4']
+
+
+def test_execute_returns_rowcount(storage):
+    with storage.session() as db:
+        _add_route(db, 'R1')
+        _add_route(db, 'R2')
+        updated = db.execute('UPDATE routes SET operator = ? WHERE route_name = ?', ('Rail', 'R1'))
+        untouched = db.execute('UPDATE routes SET operator = ? WHERE route_name = ?', ('Rail', 'none'))
+    assert (updated, untouched) == (1, 0)
+
+
+def test_literal_question_mark(storage):
+    with storage.session() as db:
+        _add_route(db, 'Why?')
+        row = db.fetch_one("SELECT route_name FROM routes WHERE route_name = 'Why?' AND route_type = ?", ('bus',))
+    assert row == {'route_name': 'Why?'}
+
+
+def test_session_rolls_back_on_error(storage):
+    with pytest.raises(RuntimeError):
+        with storage.session() as db:
+            _add_route(db, 'R1')
+            raise RuntimeError('boom')
+    with storage.session() as db:
+        assert db.fetch_all('SELECT route_id FROM routes') == []
+
+
+def test_run_script_and_vacuum(storage):
+    with storage.session() as db:
+        db.run_script('CREATE TABLE IF NOT EXISTS scratch (id INT);')
+        assert db.execute('INSERT INTO scratch (id) VALUES (?)', (1,)) == 1
+        db.run_script('DROP TABLE scratch;')
+    storage.vacuum(['routes'])
+    storage.ping()